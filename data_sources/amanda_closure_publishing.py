@@ -2,16 +2,19 @@ import datetime
 import logging
 import pandas as pd
 import pytz
+import time
 import uuid
 from sodapy import Socrata
 
-import json
 import os
 
 from amanda import get_amanda_data
 from config import amanda_closure_mapping, turp_query, excavation_permits
+from feed_server import start_feed_server
+from outputs import validate_formats, write_outputs
+from publishing import check_row_identifier, get_socrata_client, publish
 from utils import get_logger
-from workzone import AmandaWorkZone
+from workzone import AmandaWorkZone, SegmentGeometryRegistry
 
 # Socrata app token
 SO_TOKEN = os.getenv("SO_TOKEN")
@@ -24,6 +27,17 @@ SO_PASS = os.getenv("SO_PASS")
 FEED_DATASET = os.getenv("FEED_DATASET")
 FLAT_DATASET = os.getenv("FLAT_DATASET")
 
+# Optional: local copies of the flat export, OUTPUT_FORMATS is a comma separated list of formats in OUTPUT_WRITERS
+OUTPUT_DIR = os.getenv("OUTPUT_DIR")
+OUTPUT_FORMATS = [
+    f.strip() for f in (os.getenv("OUTPUT_FORMATS") or "").split(",") if f.strip()
+]
+
+# Optional: serve the feed over HTTP, regenerating it every FEED_REFRESH_INTERVAL seconds
+FEED_SERVER_HOST = os.getenv("FEED_SERVER_HOST") or "0.0.0.0"
+FEED_SERVER_PORT = os.getenv("FEED_SERVER_PORT")
+FEED_REFRESH_INTERVAL = int(os.getenv("FEED_REFRESH_INTERVAL") or 3600)
+
 
 def get_start_end_date(row):
     if not pd.isnull(row["EXTENSION_START_DATE"]) and not pd.isnull(
@@ -101,7 +115,12 @@ def create_feed_info(turp_id, ex_id, current_time):
     return feed_info
 
 
-def main():
+def main(server=None):
+    """
+    Generates the WZDx feed and publishes it.
+    :param server (FeedServer): optional feed server to publish the feed to, ahead of the Socrata upload
+    :return: the WZDx feed
+    """
     # Getting AMANDA data
     # Temporary Use of Right of Way (TURP) permits:
     logger.info(f"Querying AMANDA for TURP permits")
@@ -123,11 +142,9 @@ def main():
     ]["SEGMENT_ID"].unique()
     logger.info(f"Retrieving CTM street segments from Socrata")
     segment_info = get_geometry(segments)
-    segment_lookup = {}
 
-    # Generating a lookup dict of street segment IDs for later
-    for segment_id in segment_info:
-        segment_lookup[int(segment_id["segment_id"])] = segment_id
+    # Generating a lookup of street segment IDs shared by all work zones
+    segment_registry = SegmentGeometryRegistry(segment_info)
 
     # Generating UUIDs data sources
     amanda_turp_id = str(uuid.uuid5(uuid.NAMESPACE_OID, "COA_AMANDA_TURP"))
@@ -196,6 +213,7 @@ def main():
                 description=description,
                 start_date=start_date.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%SZ"),
                 end_date=end_date.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%SZ"),
+                segment_registry=segment_registry,
             )
             # Closure type logic
             # This is how we convert AMANDA road closures into workzone closure types
@@ -204,11 +222,10 @@ def main():
                 seg = permit_closures[permit_closures["SEGMENT_ID"] == segment_id]
                 for closure_type in amanda_closure_mapping:
                     if closure_type["amanda_closure"] in list(seg["CLOSURE_TYPE"]):
-                        if segment_id in segment_lookup:
+                        if segment_id in segment_registry:
                             wz.add_closure(
                                 segment_id,
                                 veh_impact=closure_type["vehicle_impact"],
-                                segment_info=segment_lookup[segment_id],
                             )
                             # If we find a closure type, we break out of the loop. This makes the order of
                             # amanda_closure_mapping important.
@@ -232,29 +249,43 @@ def main():
     # Stitching everything together
     output = {"feed_info": feed_info, "type": "FeatureCollection", "features": features}
 
+    # Serving the new feed before uploading so the HTTP feed doesn't depend on Socrata
+    if server is not None:
+        server.publish(output, time.time())
+
+    # Flat export shared by the Socrata flat dataset and the local output files
+    records = []
+    for wz in work_zones:
+        records += wz.generate_socrata_export()
+
     # Output to Socrata feed/dataset
+    socrata_error = None
     if SO_USER and SO_PASS:
         logger.info("Uploading data to Socrata")
-        # logging in with sodapy
-        soda = Socrata(
-            SO_WEB,
-            SO_TOKEN,
-            username=SO_USER,
-            password=SO_PASS,
-            timeout=500,
-        )
-        logger.info("uploading geojson file to Socrata")
-        files = {"file": ("wzdx_atx.geojson", json.dumps(output))}
-        response = soda.replace_non_data_file(FEED_DATASET, {}, files)
-        logger.info(response)
+        try:
+            # logging in with sodapy
+            soda = get_socrata_client(SO_WEB, SO_TOKEN, SO_USER, SO_PASS)
 
-        # for flat exporting to socrata:
-        features = []
-        for wz in work_zones:
-            features += wz.generate_socrata_export()
-        logger.info("uploading flat dataset to Socrata")
-        response = soda.replace(FLAT_DATASET, features)
-        logger.info(response)
+            logger.info("uploading geojson file and flat dataset to Socrata")
+            feed_response, flat_responses = publish(
+                soda, FEED_DATASET, output, FLAT_DATASET, records
+            )
+            logger.info(feed_response)
+            logger.info(flat_responses)
+        except Exception as e:
+            logger.exception("Failed to upload data to Socrata")
+            socrata_error = e
+
+    # Output flat export to local files, whether or not the Socrata upload succeeded
+    if OUTPUT_DIR and OUTPUT_FORMATS:
+        logger.info(f"Writing {', '.join(OUTPUT_FORMATS)} files to {OUTPUT_DIR}")
+        write_outputs(records, OUTPUT_DIR, OUTPUT_FORMATS)
+
+    # The feed server keeps running after a Socrata failure, otherwise the run should fail
+    if socrata_error is not None and server is None:
+        raise socrata_error
+
+    return output
 
 
 if __name__ == "__main__":
@@ -263,4 +294,24 @@ if __name__ == "__main__":
         level=logging.INFO,
     )
 
-    main()
+    # Checking output formats up front so a typo fails at startup rather than on every run
+    validate_formats(OUTPUT_FORMATS)
+
+    # The flat dataset is updated by id, so it must use id as its row identifier
+    if SO_USER and SO_PASS:
+        check_row_identifier(
+            get_socrata_client(SO_WEB, SO_TOKEN, SO_USER, SO_PASS), FLAT_DATASET
+        )
+
+    if FEED_SERVER_PORT:
+        server = start_feed_server(FEED_SERVER_HOST, int(FEED_SERVER_PORT))
+        while True:
+            start = time.time()
+            try:
+                main(server)
+            except Exception:
+                # Keep serving the last published feed if this refresh fails
+                logger.exception("Failed to refresh feed")
+            time.sleep(max(FEED_REFRESH_INTERVAL - (time.time() - start), 0))
+    else:
+        main()
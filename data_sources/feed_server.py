@@ -0,0 +1,238 @@
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import brotli
+from shapely import STRtree, box
+from shapely.geometry import shape
+
+from utils import get_logger
+
+logger = get_logger(__name__, level=logging.INFO)
+
+
+class FeedPayload:
+    """
+    A published WZDx feed held in memory. The full feed is serialized and compressed once when published, and each
+    feature is serialized once so filtered responses can be assembled without re-serializing the feed.
+
+    The ETag is a weak validator made from a hash of the features only. feed_info's update dates change on every
+    run, so bodies that differ only in those dates share a tag, as do the identity, gzip and brotli encodings.
+    """
+
+    def __init__(self, output, published_time):
+        """
+        :param output (dict): WZDx feed generated by main()
+        :param published_time (float): unix timestamp of when the feed was published
+        """
+        self.last_modified = formatdate(int(published_time), usegmt=True)
+        self.published_time = int(published_time)
+
+        # Everything but the features, split so feature lists can be placed in between
+        header = {k: v for k, v in output.items() if k != "features"}
+        header["features"] = []
+        prefix, suffix = json.dumps(header).encode("utf-8").rsplit(b"[]", 1)
+        self.prefix = prefix + b"["
+        self.suffix = b"]" + suffix
+
+        features = output["features"]
+        self.features = [json.dumps(f).encode("utf-8") for f in features]
+        serialized_features = b",".join(self.features)
+        self.etag = f'W/"{hashlib.sha256(serialized_features).hexdigest()}"'
+
+        self.body = self.prefix + serialized_features + self.suffix
+        self.encodings = {
+            "br": brotli.compress(self.body),
+            "gzip": gzip.compress(self.body),
+        }
+
+        # Spatial index of feature geometry for bbox queries
+        self.tree = STRtree([shape(f["geometry"]) for f in features])
+
+        # Lookup of lowercase road name to the features on that road
+        self.road_names = {}
+        for i, feature in enumerate(features):
+            for road_name in feature["properties"]["core_details"]["road_names"]:
+                # Segments without a street name have None here
+                if not road_name:
+                    continue
+                self.road_names.setdefault(road_name.lower(), set()).add(i)
+
+    def filter(self, bbox=None, road_name=None):
+        """
+        Returns the serialized feed with only the features matching the filters.
+        :param bbox (tuple): minx, miny, maxx, maxy in lon/lat
+        :param road_name (str): case-insensitive road name
+        :return: JSON bytes
+        """
+        matches = set(range(len(self.features)))
+        if bbox is not None:
+            matches &= set(self.tree.query(box(*bbox), predicate="intersects"))
+        if road_name is not None:
+            matches &= self.road_names.get(road_name.lower(), set())
+        return (
+            self.prefix
+            + b",".join(self.features[i] for i in sorted(matches))
+            + self.suffix
+        )
+
+
+class FeedServer(ThreadingHTTPServer):
+    """
+    HTTP server for the latest published WZDx feed.
+    """
+
+    def __init__(self, server_address):
+        super().__init__(server_address, FeedRequestHandler)
+        self.payload = None
+        self.lock = threading.Lock()
+
+    def publish(self, output, published_time):
+        """
+        Replaces the feed being served. Payload preparation happens before the swap so requests are never blocked.
+        Last-Modified only moves forward when the features change.
+        :param output (dict): WZDx feed generated by main()
+        :param published_time (float): unix timestamp of when the feed was published
+        """
+        payload = FeedPayload(output, published_time)
+        with self.lock:
+            if self.payload is not None and self.payload.etag == payload.etag:
+                payload.published_time = self.payload.published_time
+                payload.last_modified = self.payload.last_modified
+            self.payload = payload
+        logger.info(
+            f"Serving feed {payload.etag} with {len(payload.features)} features"
+        )
+
+    def get_payload(self):
+        with self.lock:
+            return self.payload
+
+
+class FeedRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_feed(include_body=True)
+
+    def do_HEAD(self):
+        self.send_feed(include_body=False)
+
+    def send_feed(self, include_body):
+        """
+        Responds with the feed, or just its headers for HEAD requests.
+        """
+        payload = self.server.get_payload()
+        if payload is None:
+            self.send_error(503, "Feed has not been published yet")
+            return
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            bbox = query.get("bbox")
+            if bbox is not None:
+                bbox = tuple(float(v) for v in bbox[0].split(","))
+                if len(bbox) != 4:
+                    raise ValueError
+        except ValueError:
+            self.send_error(400, "bbox must be minx,miny,maxx,maxy")
+            return
+        road_name = query.get("road_name", [None])[0]
+
+        # Filtered responses depend on the query too, so they get their own ETag
+        etag = payload.etag
+        if bbox is not None or road_name is not None:
+            query_hash = hashlib.sha256(f"{payload.etag}{url.query}".encode("utf-8"))
+            etag = f'W/"{query_hash.hexdigest()}"'
+
+        if self.is_not_modified(etag, payload.published_time):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", payload.last_modified)
+            self.end_headers()
+            return
+
+        accepted = self.get_accepted_encodings()
+        if bbox is None and road_name is None:
+            body, encoding = self.choose_encoding(payload, accepted)
+        else:
+            # Filtered responses can't be precompressed, gzip is much cheaper than brotli to do per request
+            body, encoding = payload.filter(bbox, road_name), None
+            if "gzip" in accepted:
+                body, encoding = gzip.compress(body, compresslevel=6), "gzip"
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/geo+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", payload.last_modified)
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def is_not_modified(self, etag, published_time):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-None-Match uses weak comparison, so W/ prefixes are ignored on both sides
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            return etag.removeprefix("W/") in tags or "*" in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return published_time <= since
+        return False
+
+    def get_accepted_encodings(self):
+        """
+        Returns the set of supported content codings the client accepts, skipping any with q=0.
+        """
+        qvalues = {}
+        for value in self.headers.get("Accept-Encoding", "").split(","):
+            coding, _, params = value.partition(";")
+            q = 1.0
+            for param in params.split(";"):
+                name, _, param_value = param.partition("=")
+                if name.strip() == "q":
+                    try:
+                        q = float(param_value)
+                    except ValueError:
+                        q = 0.0
+            qvalues[coding.strip().lower()] = q
+        default = qvalues.get("*", 0.0)
+        return {e for e in ("br", "gzip") if qvalues.get(e, default) > 0}
+
+    def choose_encoding(self, payload, accepted):
+        """
+        Picks the precompressed body matching the client's accepted encodings, preferring brotli.
+        """
+        for encoding in ("br", "gzip"):
+            if encoding in accepted:
+                return payload.encodings[encoding], encoding
+        return payload.body, None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_feed_server(host, port):
+    """
+    Starts the feed server on a background thread.
+    :param host (str): interface to listen on
+    :param port (int): port to listen on
+    :return: FeedServer
+    """
+    server = FeedServer((host, port))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Feed server listening on {host}:{port}")
+    return server
@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+from itertools import islice
+
+import fiona
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from shapely.geometry import shape
+
+from utils import get_logger
+
+logger = get_logger(__name__, level=logging.INFO)
+
+# Number of features buffered before they're written out, also the parquet row group size.
+BATCH_SIZE = 1000
+
+# Flat export fields that aren't written as feature properties
+EXCLUDED_FIELDS = ("type", "geometry")
+
+BOOLEAN_FIELDS = (
+    "is_start_date_verified",
+    "is_end_date_verified",
+    "is_start_position_verified",
+    "is_end_position_verified",
+)
+
+# Property names in the order they appear in generate_socrata_export()
+PROPERTY_FIELDS = (
+    "id",
+    "name",
+    "event_type",
+    "data_source_id",
+    "road_names",
+    "direction",
+    "description",
+    "start_date",
+    "end_date",
+    *BOOLEAN_FIELDS,
+    "location_method",
+    "work_zone_type",
+    "vehicle_impact",
+    "folderrsn",
+)
+
+
+def batch_records(records, batch_size=BATCH_SIZE):
+    """
+    Groups an iterable of records into lists of at most batch_size without materializing the whole iterable.
+    """
+    records = iter(records)
+    while batch := list(islice(records, batch_size)):
+        yield batch
+
+
+def get_properties(record):
+    return {k: v for k, v in record.items() if k not in EXCLUDED_FIELDS}
+
+
+def write_geojsonseq(records, path):
+    """
+    Writes the flat export as newline-delimited GeoJSON, one feature per line.
+    :param records (iterable): dicts from generate_socrata_export()
+    :param path (str): output file path
+    :return: number of features written
+    """
+    count = 0
+    with open(path, "w") as f:
+        for record in records:
+            feature = {
+                "type": "Feature",
+                "id": record["id"],
+                "properties": get_properties(record),
+                "geometry": record["geometry"],
+            }
+            f.write(json.dumps(feature) + "\n")
+            count += 1
+    return count
+
+
+def write_geoparquet(records, path):
+    """
+    Writes the flat export as GeoParquet with WKB encoded geometry, one row group per batch.
+    :param records (iterable): dicts from generate_socrata_export()
+    :param path (str): output file path
+    :return: number of features written
+    """
+    fields = [
+        pa.field(name, pa.bool_() if name in BOOLEAN_FIELDS else pa.string())
+        for name in PROPERTY_FIELDS
+    ]
+    fields.append(pa.field("geometry", pa.binary()))
+    # No crs means OGC:CRS84, which matches the lon/lat segment geometry from the open data portal
+    geo_metadata = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": {"encoding": "WKB", "geometry_types": []}},
+    }
+    schema = pa.schema(fields, metadata={"geo": json.dumps(geo_metadata)})
+
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batch_records(records):
+            columns = {
+                name: [record[name] for record in batch] for name in PROPERTY_FIELDS
+            }
+            columns["geometry"] = shapely.to_wkb(
+                [shape(record["geometry"]) for record in batch]
+            )
+            writer.write_table(pa.table(columns, schema=schema))
+            count += len(batch)
+    return count
+
+
+def write_flatgeobuf(records, path):
+    """
+    Writes the flat export as FlatGeobuf. GDAL builds the packed spatial index when the file is closed so
+    readers can fetch features by bbox.
+    :param records (iterable): dicts from generate_socrata_export()
+    :param path (str): output file path
+    :return: number of features written
+    """
+    schema = {
+        "geometry": "Unknown",
+        "properties": {
+            name: "bool" if name in BOOLEAN_FIELDS else "str" for name in PROPERTY_FIELDS
+        },
+    }
+    count = 0
+    with fiona.open(
+        path,
+        "w",
+        driver="FlatGeobuf",
+        schema=schema,
+        crs="EPSG:4326",
+        SPATIAL_INDEX="YES",
+    ) as dst:
+        for batch in batch_records(records):
+            dst.writerecords(
+                {"geometry": record["geometry"], "properties": get_properties(record)}
+                for record in batch
+            )
+            count += len(batch)
+    return count
+
+
+# Output formats for the flat export, keyed by name with the writer function and file extension for each.
+OUTPUT_WRITERS = {
+    "geojsonseq": {"writer": write_geojsonseq, "extension": "geojsonl"},
+    "geoparquet": {"writer": write_geoparquet, "extension": "parquet"},
+    "flatgeobuf": {"writer": write_flatgeobuf, "extension": "fgb"},
+}
+
+
+def validate_formats(formats):
+    """
+    Raises a ValueError if any of the format names are not in OUTPUT_WRITERS.
+    :param formats (list): names of output formats
+    """
+    unknown = [name for name in formats if name not in OUTPUT_WRITERS]
+    if unknown:
+        raise ValueError(
+            f"Unknown output format(s): {unknown}, expected any of {list(OUTPUT_WRITERS)}"
+        )
+
+
+def write_outputs(records, output_dir, formats, filename="wzdx_atx"):
+    """
+    Writes the flattened export to the requested formats. These files are optional, so a failure writing one
+    format is logged and the remaining formats are still written.
+    :param records (list): dicts from generate_socrata_export()
+    :param output_dir (str): directory the files are written to
+    :param formats (list): names of formats found in OUTPUT_WRITERS
+    :param filename (str): output file name without extension
+    :return: dict of format name to output file path, for the formats that were written
+    """
+    paths = {}
+    for name in formats:
+        output = OUTPUT_WRITERS[name]
+        path = os.path.join(output_dir, f"{filename}.{output['extension']}")
+        # Writing to a temp file in the same directory then swapping it in, so readers never see a partial file
+        temp_path = os.path.join(output_dir, f".{filename}.tmp.{output['extension']}")
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            count = output["writer"](records, temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            logger.exception(f"Failed to write {name} output to {path}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            continue
+        logger.info(f"Wrote {count} features to {path}")
+        paths[name] = path
+    return paths
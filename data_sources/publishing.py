@@ -0,0 +1,246 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from sodapy import Socrata
+
+from utils import get_logger
+
+logger = get_logger(__name__, level=logging.INFO)
+
+# Upper bounds on the size of a single flat dataset upload request.
+CHUNK_MAX_BYTES = 5 * 1024 * 1024
+CHUNK_MAX_ROWS = 1000
+
+# Per-request timeout in seconds, requests are size-bounded so this can stay well under the hourly refresh.
+REQUEST_TIMEOUT = 60
+
+# Retry settings for each upload request. Delays grow as BACKOFF_FACTOR * 2 ** attempt seconds, and a request
+# is not retried once MAX_RETRY_TIME seconds have passed since its first attempt.
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 2
+MAX_RETRY_TIME = 300
+
+# HTTP status codes that are worth retrying, anything else is raised immediately.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def get_socrata_client(
+    domain,
+    app_token,
+    username,
+    password,
+    timeout=REQUEST_TIMEOUT,
+    prefix="https://",
+):
+    """
+    Returns a sodapy client whose underlying requests session uses a connection pool large enough to be
+    shared by the concurrent uploads below.
+    :param domain (str): Socrata domain to publish to
+    :param app_token (str): Socrata app token
+    :param username (str): Socrata username
+    :param password (str): Socrata password
+    :param timeout (int): request timeout in seconds
+    :param prefix (str): URL scheme of the domain
+    :return: sodapy Socrata client
+    """
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+    return Socrata(
+        domain,
+        app_token,
+        username=username,
+        password=password,
+        timeout=timeout,
+        session_adapter={"prefix": prefix, "adapter": adapter},
+    )
+
+
+def chunk_records(records, max_bytes=CHUNK_MAX_BYTES, max_rows=CHUNK_MAX_ROWS):
+    """
+    Splits a list of records into chunks bounded by both row count and serialized JSON size.
+    :param records (list): list of dicts to be uploaded
+    :param max_bytes (int): maximum serialized size of a chunk
+    :param max_rows (int): maximum number of rows in a chunk
+    :return: generator of (chunk, chunk size in bytes) tuples
+    """
+    chunk = []
+    chunk_bytes = 0
+    for record in records:
+        record_bytes = len(json.dumps(record).encode("utf-8"))
+        if chunk and (
+            chunk_bytes + record_bytes > max_bytes or len(chunk) >= max_rows
+        ):
+            yield chunk, chunk_bytes
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(record)
+        chunk_bytes += record_bytes
+    if chunk:
+        yield chunk, chunk_bytes
+
+
+def is_retryable(error):
+    """
+    Returns True if the request exception is a transient failure we should retry.
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        return (
+            error.response is not None
+            and error.response.status_code in RETRY_STATUS_CODES
+        )
+    return isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    )
+
+
+def with_retries(
+    func,
+    *args,
+    retries=MAX_RETRIES,
+    backoff_factor=BACKOFF_FACTOR,
+    max_retry_time=MAX_RETRY_TIME,
+    **kwargs,
+):
+    """
+    Calls func(*args, **kwargs), retrying transient request failures with exponential backoff.
+    :param func: function to call
+    :param retries (int): number of retries before giving up
+    :param backoff_factor (int): base delay in seconds between attempts
+    :param max_retry_time (int): seconds after the first attempt past which no retry is started
+    :return: the return value of func
+    """
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            delay = backoff_factor * 2**attempt
+            if (
+                attempt >= retries
+                or not is_retryable(e)
+                or time.monotonic() - start + delay > max_retry_time
+            ):
+                raise
+            logger.warning(f"Request failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def check_row_identifier(soda, dataset, field_name="id"):
+    """
+    Raises a ValueError unless the dataset uses field_name as its row identifier. upload_flat_dataset upserts
+    and deletes rows by id, so without it every run would append duplicate rows.
+    :param soda: sodapy Socrata client
+    :param dataset (str): Socrata dataset ID of the flat dataset
+    :param field_name (str): column that should be the row identifier
+    """
+    metadata = with_retries(soda.get_metadata, dataset)
+    columns = {c["id"]: c["fieldName"] for c in metadata.get("columns", [])}
+    row_identifier = columns.get(metadata.get("rowIdentifierColumnId"))
+    if row_identifier != field_name:
+        raise ValueError(
+            f"Dataset {dataset} must use {field_name} as its row identifier, found {row_identifier}"
+        )
+
+
+def upload_feed(soda, dataset, output):
+    """
+    Replaces the WZDx geojson file attached to the feed dataset.
+    :param soda: sodapy Socrata client
+    :param dataset (str): Socrata dataset ID of the feed
+    :param output (dict): WZDx feed
+    :return: Socrata response
+    """
+    payload = json.dumps(output)
+    start = time.monotonic()
+    files = {"file": ("wzdx_atx.geojson", payload)}
+    response = with_retries(soda.replace_non_data_file, dataset, {}, files)
+    elapsed = time.monotonic() - start
+    logger.info(
+        f"Uploaded geojson file ({len(payload) / 1024:.0f} KB) in {elapsed:.1f}s"
+    )
+    return response
+
+
+def get_existing_ids(soda, dataset):
+    """
+    Returns the set of row IDs currently published to the flat dataset.
+    :param soda: sodapy Socrata client
+    :param dataset (str): Socrata dataset ID of the flat dataset
+    :return: set of IDs
+    """
+    rows = with_retries(soda.get, dataset, select="id", limit=999999)
+    return {row["id"] for row in rows}
+
+
+def upload_chunks(soda, dataset, records):
+    """
+    Upserts records to a dataset in size-bounded chunks, retrying each chunk on its own.
+    :return: tuple of the list of Socrata responses and the total bytes sent
+    """
+    responses = []
+    total_bytes = 0
+    for chunk, chunk_bytes in chunk_records(records):
+        chunk_start = time.monotonic()
+        responses.append(with_retries(soda.upsert, dataset, chunk))
+        total_bytes += chunk_bytes
+        logger.info(
+            f"Upserted chunk {len(responses)} ({len(chunk)} rows, {chunk_bytes / 1024:.0f} KB) "
+            f"in {time.monotonic() - chunk_start:.1f}s"
+        )
+    return responses, total_bytes
+
+
+def upload_flat_dataset(soda, dataset, records):
+    """
+    Updates the flat dataset to match records. The dataset's row identifier must be the id column: every record
+    is upserted by id in chunks, then the rows whose ids are no longer in the export are deleted.
+
+    The dataset is never emptied or truncated during an upload. If a chunk still fails after its retries the
+    exception is raised and the dataset keeps its previous rows, with any chunks that already landed updated in
+    place. Stale rows are only deleted once every chunk succeeded, so a failed run leaves them for the next run.
+    :param soda: sodapy Socrata client
+    :param dataset (str): Socrata dataset ID of the flat dataset
+    :param records (list): list of dicts from generate_socrata_export()
+    :return: list of Socrata responses, one per chunk
+    """
+    start = time.monotonic()
+    existing_ids = get_existing_ids(soda, dataset)
+
+    responses, total_bytes = upload_chunks(soda, dataset, records)
+
+    # Removing work zones that are no longer in the feed
+    stale_ids = existing_ids - {record["id"] for record in records}
+    if stale_ids:
+        logger.info(f"Deleting {len(stale_ids)} stale rows from flat dataset")
+        deletions = [{"id": row_id, ":deleted": True} for row_id in sorted(stale_ids)]
+        delete_responses, delete_bytes = upload_chunks(soda, dataset, deletions)
+        responses += delete_responses
+        total_bytes += delete_bytes
+
+    elapsed = time.monotonic() - start
+    logger.info(
+        f"Uploaded {len(records)} rows ({total_bytes / 1024:.0f} KB) to flat dataset in {elapsed:.1f}s, "
+        f"{total_bytes / 1024 / max(elapsed, 0.001):.0f} KB/s"
+    )
+    return responses
+
+
+def publish(soda, feed_dataset, output, flat_dataset, records):
+    """
+    Uploads the geojson feed and the flat dataset to Socrata concurrently on the same client session.
+    :param soda: sodapy Socrata client
+    :param feed_dataset (str): Socrata dataset ID of the feed
+    :param output (dict): WZDx feed
+    :param flat_dataset (str): Socrata dataset ID of the flat dataset
+    :param records (list): list of dicts from generate_socrata_export()
+    :return: tuple of the feed response and the list of flat dataset responses
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        feed_future = executor.submit(upload_feed, soda, feed_dataset, output)
+        flat_future = executor.submit(upload_flat_dataset, soda, flat_dataset, records)
+        return feed_future.result(), flat_future.result()
@@ -1,9 +1,68 @@
 import uuid
 from shapely.ops import linemerge
-import geopandas as gpd
 from shapely.geometry import shape, mapping
 
 
+class SegmentGeometryRegistry:
+    """
+    Lookup of street segments by segment ID. Each segment geometry is parsed into shapely once and shared, along
+    with its GeoJSON serialization, by every work zone that references it.
+    """
+
+    def __init__(self, segment_data):
+        """
+        :param segment_data (list): list of street segment dicts from the open data portal
+        """
+        self.segments = {int(s["segment_id"]): s for s in segment_data}
+        self._shapes = {}
+        self._geojson = {}
+        # Merged geometry keyed by the set of segment IDs that were merged
+        self._merged = {}
+
+    def __contains__(self, segment_id):
+        return segment_id in self.segments
+
+    def __len__(self):
+        return len(self.segments)
+
+    def get(self, segment_id):
+        return self.segments[segment_id]
+
+    def get_shape(self, segment_id):
+        """
+        Returns the shapely geometry of a segment, parsing it on first use.
+        """
+        if segment_id not in self._shapes:
+            self._shapes[segment_id] = shape(self.segments[segment_id]["the_geom"])
+        return self._shapes[segment_id]
+
+    def get_geojson(self, segment_id):
+        """
+        Returns the GeoJSON geometry of a segment, serialized from the shared shapely geometry.
+        """
+        if segment_id not in self._geojson:
+            self._geojson[segment_id] = mapping(self.get_shape(segment_id))
+        return self._geojson[segment_id]
+
+    def merge(self, segment_ids):
+        """
+        Attempts to merge a list of segments into a single continuous line. Results are cached so permits
+        closing the same set of segments reuse the merged geometry.
+        :param segment_ids (list): segment IDs to merge
+        :return: GeoJSON geometry of the merged line, or None if the segments are disjointed
+        """
+        key = frozenset(segment_ids)
+        if key not in self._merged:
+            merged_segments = linemerge([self.get_shape(s) for s in segment_ids])
+            # If a single linestring is returned, we know we have successfully combined all segments
+            if merged_segments.geom_type == "LineString":
+                self._merged[key] = mapping(merged_segments)
+            # If a multiline is returned, we failed to combine as the segments are likely disjointed
+            else:
+                self._merged[key] = None
+        return self._merged[key]
+
+
 class WorkZone:
     """
     Base class for work zones. Maybe too many COA-specific terms here like dealing with segment geometry?
@@ -16,6 +75,7 @@ class WorkZone:
         description: str,
         start_date: str,
         end_date: str,
+        segment_registry: SegmentGeometryRegistry,
     ):
         """
         :param data_source_id (str): UUID of the data source, also shown in the feed_info section
@@ -23,12 +83,14 @@ class WorkZone:
         :param description (str): A description of the WorkZone
         :param start_date (str): UTC start date, strftime format: %Y-%m-%dT%H:%M:%SZ
         :param end_date (str):UTC start date, strftime format: %Y-%m-%dT%H:%M:%SZ
+        :param segment_registry (SegmentGeometryRegistry): shared lookup of street segment geometry
         """
         self.data_source_id = data_source_id
         self.name = name
         self.start_date = start_date
         self.end_date = end_date
         self.description = description
+        self.segment_registry = segment_registry
 
         # Starting an empty array of segments we will add to later.
         self.segments = []
@@ -37,14 +99,13 @@ class WorkZone:
         cls = self.__class__.__name__
         return f"{cls}:{self.name}"
 
-    def add_closure(
-        self, segment_id, veh_impact: str, segment_info, direction="unknown"
-    ):
+    def add_closure(self, segment_id, veh_impact: str, direction="unknown"):
+        segment_info = self.segment_registry.get(segment_id)
         self.segments.append(
             {
                 "segment_id": segment_id,
                 "vehicle_impact": veh_impact,
-                "geometry": segment_info["the_geom"],
+                "geometry": self.segment_registry.get_geojson(segment_id),
                 "feature_data": segment_info,
                 "direction": direction,
                 "street_place_id": segment_info["street_place_id"],
@@ -71,41 +132,36 @@ class WorkZone:
         Takes the current list of roadway segments and combines them if they are continuous segments on the same road.
         """
         if len(self.segments) > 1:
-            for i in self.segments:
-                i["geometry"] = shape(i["geometry"])
-
-            segment_df = gpd.GeoDataFrame(self.segments, geometry="geometry")
-
-            # Get list of road names
-            places = segment_df["street_place_id"].unique()
-            # Get types of closures
-            closure_types = segment_df["vehicle_impact"].unique()
+            # Get types of closures and list of road names, in the order they first appear
+            closure_types = list(
+                dict.fromkeys(s["vehicle_impact"] for s in self.segments)
+            )
+            places = list(dict.fromkeys(s["street_place_id"] for s in self.segments))
 
             # For each road/closure type try to reduce the geometry
             reduced_segments = []
             for type in closure_types:
                 for place in places:
-                    place_df = segment_df[segment_df["vehicle_impact"] == type]
-                    place_df = place_df[place_df["street_place_id"] == place]
-                    if len(place_df) > 1:  # We need more than 1 segment to reduce
+                    place_segments = [
+                        s
+                        for s in self.segments
+                        if s["vehicle_impact"] == type
+                        and s["street_place_id"] == place
+                    ]
+                    if len(place_segments) > 1:  # We need more than 1 segment to reduce
                         # Attempt to merge the list of line geometries.
-                        merged_segments = linemerge(list(place_df["geometry"]))
-
-                        # If a single linestring is returned, we know we have successfully combined all segments
-                        if merged_segments.geom_type == "LineString":
-                            edited_segment = dict(place_df.iloc[0])
-                            edited_segment["geometry"] = merged_segments
+                        merged_geometry = self.segment_registry.merge(
+                            [s["segment_id"] for s in place_segments]
+                        )
+                        if merged_geometry is not None:
+                            edited_segment = dict(place_segments[0])
+                            edited_segment["geometry"] = merged_geometry
                             reduced_segments.append(edited_segment)
-
-                        # If a multiline is returned, we failed to combine as the segments are likely disjointed
-                        elif merged_segments.geom_type == "MultiLineString":
-                            reduced_segments += place_df.to_dict("records")
+                        else:
+                            reduced_segments += place_segments
                     else:
-                        reduced_segments += place_df.to_dict("records")
+                        reduced_segments += place_segments
 
-            # Converting from WKT back to geojson
-            for segment in reduced_segments:
-                segment["geometry"] = mapping(segment["geometry"])
             self.segments = reduced_segments
 
     def generate_json(self):
@@ -158,6 +214,7 @@ class AmandaWorkZone(WorkZone):
         start_date: str,
         end_date: str,
         folderrsn: int,
+        segment_registry: SegmentGeometryRegistry,
     ):
         """
         :param data_source_id (str): UUID of the data source, also shown in the feed_info section
@@ -166,8 +223,11 @@ class AmandaWorkZone(WorkZone):
         :param start_date (str): UTC start date, strftime format: %Y-%m-%dT%H:%M:%SZ
         :param end_date (str):UTC start date, strftime format: %Y-%m-%dT%H:%M:%SZ,
         :param folderrsn: Unique ID of this AMANDA record.
+        :param segment_registry (SegmentGeometryRegistry): shared lookup of street segment geometry
         """
-        super().__init__(data_source_id, name, description, start_date, end_date)
+        super().__init__(
+            data_source_id, name, description, start_date, end_date, segment_registry
+        )
         self.folderrsn = folderrsn
 
     def generate_closure_id(self, segment_id):
@@ -0,0 +1,221 @@
+import gzip
+import http.client
+import json
+import threading
+
+import brotli
+import pytest
+
+from feed_server import FeedServer
+
+
+def make_feature(feature_id, road_name, x):
+    return {
+        "id": feature_id,
+        "type": "Feature",
+        "properties": {"core_details": {"road_names": [road_name]}},
+        "geometry": {"type": "LineString", "coordinates": [[x, 30.0], [x + 0.5, 30.0]]},
+    }
+
+
+def make_output(update_date="2024-01-01T00:00:00Z", features=None):
+    if features is None:
+        features = [
+            make_feature("a", "Congress Ave", 0),
+            make_feature("b", "Lamar Blvd", 1),
+            make_feature("c", "Congress Ave", 2),
+        ]
+    return {
+        "feed_info": {"update_date": update_date},
+        "type": "FeatureCollection",
+        "features": features,
+    }
+
+
+@pytest.fixture
+def server():
+    server = FeedServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, path="/", method="GET", **headers):
+    """
+    Returns the response and its raw body, without any automatic decompression.
+    """
+    conn = http.client.HTTPConnection(*server.server_address)
+    headers.setdefault("Accept-Encoding", "identity")
+    conn.request(method, path, headers=headers)
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, body
+
+
+def feature_ids(body):
+    return [f["id"] for f in json.loads(body)["features"]]
+
+
+def test_not_published(server):
+    response, _ = request(server)
+    assert response.status == 503
+
+
+def test_get_feed(server):
+    output = make_output()
+    server.publish(output, 1700000000)
+    response, body = request(server)
+
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "application/geo+json"
+    assert response.getheader("Content-Encoding") is None
+    assert response.getheader("ETag").startswith('W/"')
+    assert response.getheader("Last-Modified") == "Tue, 14 Nov 2023 22:13:20 GMT"
+    assert json.loads(body) == output
+
+
+def test_head(server):
+    server.publish(make_output(), 1700000000)
+    get_response, get_body = request(server)
+    response, body = request(server, method="HEAD")
+
+    assert response.status == 200
+    assert body == b""
+    assert response.getheader("Content-Length") == str(len(get_body))
+    assert response.getheader("ETag") == get_response.getheader("ETag")
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0, gzip", "gzip"),
+        ("br;q=0, gzip;q=0", None),
+        ("*", "br"),
+        ("*;q=0", None),
+        ("identity", None),
+    ],
+)
+def test_content_encoding(server, accept_encoding, expected):
+    output = make_output()
+    server.publish(output, 1700000000)
+    response, body = request(server, **{"Accept-Encoding": accept_encoding})
+
+    assert response.getheader("Content-Encoding") == expected
+    assert response.getheader("Vary") == "Accept-Encoding"
+    decompress = {"br": brotli.decompress, "gzip": gzip.decompress, None: bytes}
+    assert json.loads(decompress[expected](body)) == output
+
+
+def test_if_none_match(server):
+    server.publish(make_output(), 1700000000)
+    etag = request(server)[0].getheader("ETag")
+
+    response, body = request(server, **{"If-None-Match": etag})
+    assert response.status == 304
+    assert body == b""
+    assert response.getheader("ETag") == etag
+
+    # Weak comparison, the tag matches with or without W/ and in a list
+    strong = etag.removeprefix("W/")
+    assert request(server, **{"If-None-Match": strong})[0].status == 304
+    assert request(server, **{"If-None-Match": f'"other", {etag}'})[0].status == 304
+    assert request(server, **{"If-None-Match": '"other"'})[0].status == 200
+
+
+def test_if_modified_since(server):
+    server.publish(make_output(), 1700000000)
+    headers = {"If-Modified-Since": "Tue, 14 Nov 2023 22:13:20 GMT"}
+    assert request(server, **headers)[0].status == 304
+    headers = {"If-Modified-Since": "Tue, 14 Nov 2023 22:13:19 GMT"}
+    assert request(server, **headers)[0].status == 200
+
+
+def test_republish_unchanged_features(server):
+    server.publish(make_output("2024-01-01T00:00:00Z"), 1700000000)
+    first, _ = request(server)
+    server.publish(make_output("2024-01-01T01:00:00Z"), 1700003600)
+    second, body = request(server)
+
+    # The body is rebuilt with the new update date, while the validators stay the same
+    assert json.loads(body)["feed_info"]["update_date"] == "2024-01-01T01:00:00Z"
+    assert second.getheader("ETag") == first.getheader("ETag")
+    assert second.getheader("Last-Modified") == first.getheader("Last-Modified")
+    assert (
+        request(server, **{"If-None-Match": first.getheader("ETag")})[0].status == 304
+    )
+
+
+def test_republish_changed_features(server):
+    server.publish(make_output(), 1700000000)
+    first, _ = request(server)
+    server.publish(
+        make_output(features=[make_feature("a", "Lamar Blvd", 0)]), 1700003600
+    )
+    second, _ = request(server)
+
+    assert second.getheader("ETag") != first.getheader("ETag")
+    assert second.getheader("Last-Modified") == "Tue, 14 Nov 2023 23:13:20 GMT"
+    assert (
+        request(server, **{"If-None-Match": first.getheader("ETag")})[0].status == 200
+    )
+
+
+def test_missing_road_names(server):
+    features = [make_feature("a", None, 0), make_feature("b", "", 1)]
+    server.publish(make_output(features=features), 1700000000)
+
+    assert feature_ids(request(server)[1]) == ["a", "b"]
+    assert feature_ids(request(server, "/?road_name=congress%20ave")[1]) == []
+
+
+def test_filter_road_name(server):
+    server.publish(make_output(), 1700000000)
+    response, body = request(server, "/?road_name=congress%20ave")
+
+    assert response.status == 200
+    assert feature_ids(body) == ["a", "c"]
+    assert json.loads(body)["feed_info"] == make_output()["feed_info"]
+
+
+def test_filter_bbox(server):
+    server.publish(make_output(), 1700000000)
+    _, body = request(server, "/?bbox=0.9,29.9,2.1,30.1")
+    assert feature_ids(body) == ["b", "c"]
+
+
+def test_filter_bbox_and_road_name(server):
+    server.publish(make_output(), 1700000000)
+    _, body = request(server, "/?bbox=0.9,29.9,2.1,30.1&road_name=Congress%20Ave")
+    assert feature_ids(body) == ["c"]
+
+
+@pytest.mark.parametrize("bbox", ["1,2,3", "a,b,c,d"])
+def test_filter_bad_bbox(server, bbox):
+    server.publish(make_output(), 1700000000)
+    assert request(server, f"/?bbox={bbox}")[0].status == 400
+
+
+def test_filter_etag(server):
+    server.publish(make_output(), 1700000000)
+    full, _ = request(server)
+    filtered, _ = request(server, "/?road_name=Lamar%20Blvd")
+
+    assert filtered.getheader("ETag") != full.getheader("ETag")
+    headers = {"If-None-Match": filtered.getheader("ETag")}
+    assert request(server, "/?road_name=Lamar%20Blvd", **headers)[0].status == 304
+    assert request(server, "/?road_name=Congress%20Ave", **headers)[0].status == 200
+
+
+def test_filter_gzip(server):
+    server.publish(make_output(), 1700000000)
+    response, body = request(
+        server, "/?road_name=Lamar%20Blvd", **{"Accept-Encoding": "br, gzip"}
+    )
+
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert feature_ids(gzip.decompress(body)) == ["b"]
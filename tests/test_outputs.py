@@ -0,0 +1,181 @@
+import json
+import os
+
+import fiona
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import shapely
+
+import outputs
+
+
+def make_record(i):
+    """
+    A record shaped like AmandaWorkZone.generate_socrata_export(), one short line per record spaced along x.
+    """
+    return {
+        "id": f"id-{i}",
+        "name": f"Work zone {i}",
+        "type": "Feature",
+        "geometry": {
+            "type": "LineString",
+            "coordinates": [[-97.7 + i * 0.01, 30.2], [-97.7 + i * 0.01 + 0.005, 30.2]],
+        },
+        "event_type": "work-zone",
+        "data_source_id": "source",
+        "road_names": f"STREET {i}",
+        "direction": "unknown",
+        "description": "Excavation Permit has been issued for this location.",
+        "start_date": "2024-01-01T06:00:00Z",
+        "end_date": "2024-01-02T06:00:00Z",
+        "is_start_date_verified": False,
+        "is_end_date_verified": False,
+        "is_start_position_verified": False,
+        "is_end_position_verified": False,
+        "location_method": "other",
+        "work_zone_type": "static",
+        "vehicle_impact": "some-lanes-closed",
+        "folderrsn": str(i),
+    }
+
+
+@pytest.fixture
+def records():
+    # More than one batch so the writers have to append
+    return [make_record(i) for i in range(outputs.BATCH_SIZE + 5)]
+
+
+def test_write_geojsonseq(tmp_path, records):
+    path = tmp_path / "out.geojsonl"
+    assert outputs.write_geojsonseq(records, path) == len(records)
+
+    with open(path) as f:
+        features = [json.loads(line) for line in f]
+    assert len(features) == len(records)
+    assert features[0]["type"] == "Feature"
+    assert features[0]["id"] == "id-0"
+    assert features[0]["geometry"] == records[0]["geometry"]
+    assert list(features[0]["properties"]) == list(outputs.PROPERTY_FIELDS)
+
+
+def test_write_geoparquet(tmp_path, records):
+    path = tmp_path / "out.parquet"
+    assert outputs.write_geoparquet(records, path) == len(records)
+
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_rows == len(records)
+    assert parquet_file.metadata.num_row_groups == 2
+
+    table = parquet_file.read()
+    for name in outputs.PROPERTY_FIELDS:
+        expected = pa.bool_() if name in outputs.BOOLEAN_FIELDS else pa.string()
+        assert table.schema.field(name).type == expected
+    assert table.schema.field("geometry").type == pa.binary()
+    assert table.column("id").to_pylist() == [r["id"] for r in records]
+
+    geo = json.loads(table.schema.metadata[b"geo"])
+    assert geo["version"] == "1.0.0"
+    assert geo["primary_column"] == "geometry"
+    assert geo["columns"]["geometry"]["encoding"] == "WKB"
+
+    geometry = shapely.from_wkb(table.column("geometry").to_pylist()[0])
+    assert geometry.equals(shapely.geometry.shape(records[0]["geometry"]))
+
+
+def test_write_geoparquet_selected_columns(tmp_path, records):
+    path = tmp_path / "out.parquet"
+    outputs.write_geoparquet(records, path)
+
+    table = pq.read_table(path, columns=["id", "vehicle_impact"])
+    assert table.column_names == ["id", "vehicle_impact"]
+    assert table.num_rows == len(records)
+
+
+def test_write_flatgeobuf(tmp_path, records):
+    path = tmp_path / "out.fgb"
+    assert outputs.write_flatgeobuf(records, path) == len(records)
+
+    with fiona.open(path) as src:
+        assert len(src) == len(records)
+        properties = src.schema["properties"]
+        assert list(properties) == list(outputs.PROPERTY_FIELDS)
+        # Fiona 1.9 reports boolean fields as int in the schema, the values still read back as bools
+        for name in outputs.PROPERTY_FIELDS:
+            expected = "int" if name in outputs.BOOLEAN_FIELDS else "str"
+            assert properties[name].split(":")[0] == expected
+        # Features are stored in spatial index order rather than the order they were written
+        features = {f["properties"]["id"]: f for f in src}
+        assert sorted(features) == sorted(r["id"] for r in records)
+        feature = features["id-0"]
+        assert feature["properties"]["folderrsn"] == "0"
+        for name in outputs.BOOLEAN_FIELDS:
+            assert feature["properties"][name] is False
+
+
+def test_write_flatgeobuf_bbox_read(tmp_path, records):
+    path = tmp_path / "out.fgb"
+    outputs.write_flatgeobuf(records, path)
+
+    # Only records 2 and 3 fall inside this bbox
+    bbox = (-97.7 + 0.019, 30.1, -97.7 + 0.036, 30.3)
+    with fiona.open(path) as src:
+        ids = sorted(f["properties"]["id"] for f in src.filter(bbox=bbox))
+    assert ids == ["id-2", "id-3"]
+
+
+def test_write_flatgeobuf_spatial_index(tmp_path, records):
+    path = tmp_path / "out.fgb"
+    outputs.write_flatgeobuf(records, path)
+
+    # The same features written without an index, the difference in size is the packed R-tree
+    unindexed_path = tmp_path / "unindexed.fgb"
+    with fiona.open(path) as src:
+        with fiona.open(
+            unindexed_path,
+            "w",
+            driver="FlatGeobuf",
+            schema=src.schema,
+            crs=src.crs,
+            SPATIAL_INDEX="NO",
+        ) as dst:
+            dst.writerecords(src)
+    assert os.path.getsize(path) > os.path.getsize(unindexed_path)
+
+
+def test_write_outputs(tmp_path, records):
+    paths = outputs.write_outputs(records, tmp_path, list(outputs.OUTPUT_WRITERS))
+
+    assert sorted(paths) == sorted(outputs.OUTPUT_WRITERS)
+    assert sorted(os.listdir(tmp_path)) == [
+        "wzdx_atx.fgb",
+        "wzdx_atx.geojsonl",
+        "wzdx_atx.parquet",
+    ]
+
+
+def test_write_outputs_failure_keeps_previous_file(tmp_path, records, monkeypatch):
+    previous = tmp_path / "wzdx_atx.geojsonl"
+    previous.write_text("previous\n")
+
+    def failing_writer(records, path):
+        with open(path, "w") as f:
+            f.write("partial")
+        raise OSError("No space left on device")
+
+    monkeypatch.setitem(
+        outputs.OUTPUT_WRITERS,
+        "geojsonseq",
+        {"writer": failing_writer, "extension": "geojsonl"},
+    )
+    paths = outputs.write_outputs(records, tmp_path, ["geojsonseq", "geoparquet"])
+
+    assert list(paths) == ["geoparquet"]
+    assert previous.read_text() == "previous\n"
+    assert sorted(os.listdir(tmp_path)) == ["wzdx_atx.geojsonl", "wzdx_atx.parquet"]
+
+
+def test_validate_formats():
+    outputs.validate_formats(["geoparquet", "flatgeobuf"])
+    with pytest.raises(ValueError):
+        outputs.validate_formats(["geoparquet", "parquet"])
@@ -0,0 +1,247 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import publishing
+
+
+class StandInSocrata(ThreadingHTTPServer):
+    """
+    Local stand-in for the Socrata endpoints used by sodapy's get, upsert and replace_non_data_file.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInSocrataHandler)
+        self.rows = {}
+        self.files = {}
+        self.metadata = {
+            "rowIdentifierColumnId": 2,
+            "columns": [{"id": 1, "fieldName": "name"}, {"id": 2, "fieldName": "id"}],
+        }
+        self.requests = []
+        # Status codes to respond with before handling requests normally, keyed by method
+        self.failures = {"GET": [], "POST": []}
+        # When set, the first file upload and the first upsert both wait on this barrier
+        self.barrier = None
+        self.waited = set()
+        self.lock = threading.Lock()
+
+
+class StandInSocrataHandler(BaseHTTPRequestHandler):
+    def respond(self, status, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def handle_request(self, method):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        path = self.path.split("?")[0]
+        kind = "file" if path.startswith("/api/views/") else "resource"
+        with self.server.lock:
+            self.server.requests.append((method, kind, body))
+            failures = self.server.failures[method]
+            status = failures.pop(0) if failures else None
+        if status is not None:
+            self.respond(status, {"message": "stand-in failure"})
+            return
+
+        if self.server.barrier is not None and method == "POST":
+            with self.server.lock:
+                wait = kind not in self.server.waited
+                self.server.waited.add(kind)
+            if wait:
+                try:
+                    self.server.barrier.wait()
+                except threading.BrokenBarrierError:
+                    self.respond(400, {"message": "uploads did not overlap"})
+                    return
+
+        if method == "GET" and kind == "file":
+            self.respond(200, self.server.metadata)
+        elif method == "GET":
+            with self.server.lock:
+                self.respond(200, [{"id": row_id} for row_id in self.server.rows])
+        elif kind == "file":
+            dataset = re.match(r"/api/views/(.+)\.txt", path).group(1)
+            with self.server.lock:
+                self.server.files[dataset] = body
+            self.respond(200, {"id": dataset})
+        else:
+            rows = json.loads(body)
+            with self.server.lock:
+                for row in rows:
+                    if row.get(":deleted"):
+                        self.server.rows.pop(row["id"], None)
+                    else:
+                        self.server.rows[row["id"]] = row
+            self.respond(200, {"Rows Upserted": len(rows)})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(publishing.time, "sleep", lambda seconds: None)
+    server = StandInSocrata()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def soda(server):
+    host, port = server.server_address
+    soda = publishing.get_socrata_client(
+        f"{host}:{port}", "token", "user", "pass", timeout=5, prefix="http://"
+    )
+    yield soda
+    soda.close()
+
+
+def make_records(count, size=10):
+    return [{"id": str(i), "name": "x" * size} for i in range(count)]
+
+
+def upserts(server):
+    return [r for r in server.requests if r[0] == "POST" and r[1] == "resource"]
+
+
+def test_chunk_records_by_rows():
+    chunks = list(publishing.chunk_records(make_records(25), max_rows=10))
+    assert [len(chunk) for chunk, _ in chunks] == [10, 10, 5]
+
+
+def test_chunk_records_by_bytes():
+    records = make_records(5)
+    record_bytes = len(json.dumps(records[0]).encode("utf-8"))
+    chunks = list(
+        publishing.chunk_records(records, max_bytes=int(record_bytes * 2.5))
+    )
+    assert [len(chunk) for chunk, _ in chunks] == [2, 2, 1]
+    assert [chunk_bytes for _, chunk_bytes in chunks] == [
+        record_bytes * 2,
+        record_bytes * 2,
+        record_bytes,
+    ]
+
+
+def test_chunk_records_oversized_record():
+    records = [{"id": "big", "name": "x" * 100}, {"id": "small", "name": ""}]
+    chunks = list(publishing.chunk_records(records, max_bytes=50))
+    assert [[r["id"] for r in chunk] for chunk, _ in chunks] == [["big"], ["small"]]
+
+
+def test_upload_flat_dataset_in_chunks(server, soda):
+    records = make_records(2500)
+    responses = publishing.upload_flat_dataset(soda, "flat-data", records)
+
+    assert len(responses) == 3
+    assert [len(json.loads(r[2])) for r in upserts(server)] == [1000, 1000, 500]
+    assert server.rows == {r["id"]: r for r in records}
+
+
+def test_upload_flat_dataset_deletes_stale_rows(server, soda):
+    server.rows = {"stale": {"id": "stale"}, "0": {"id": "0", "name": "old"}}
+    records = make_records(2)
+    publishing.upload_flat_dataset(soda, "flat-data", records)
+
+    assert server.rows == {r["id"]: r for r in records}
+
+
+def test_upload_flat_dataset_empty_records(server, soda):
+    server.rows = {"a": {"id": "a"}, "b": {"id": "b"}}
+    publishing.upload_flat_dataset(soda, "flat-data", [])
+
+    assert server.rows == {}
+    assert json.loads(upserts(server)[0][2]) == [
+        {"id": "a", ":deleted": True},
+        {"id": "b", ":deleted": True},
+    ]
+
+
+def test_upload_flat_dataset_empty_records_no_existing_rows(server, soda):
+    assert publishing.upload_flat_dataset(soda, "flat-data", []) == []
+    assert upserts(server) == []
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_transient_errors(server, soda, status):
+    server.failures["POST"] = [status, status]
+    records = make_records(3)
+    publishing.upload_flat_dataset(soda, "flat-data", records)
+
+    assert len(upserts(server)) == 3
+    assert server.rows == {r["id"]: r for r in records}
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+def test_does_not_retry_client_errors(server, soda, status):
+    server.rows = {"existing": {"id": "existing"}}
+    server.failures["POST"] = [status]
+    with pytest.raises(requests.exceptions.HTTPError):
+        publishing.upload_flat_dataset(soda, "flat-data", make_records(3))
+
+    assert len(upserts(server)) == 1
+    # A failed upload leaves the previous rows in place
+    assert server.rows == {"existing": {"id": "existing"}}
+
+
+def test_gives_up_after_max_retries(server, soda):
+    server.failures["POST"] = [503] * (publishing.MAX_RETRIES + 1)
+    with pytest.raises(requests.exceptions.HTTPError):
+        publishing.upload_flat_dataset(soda, "flat-data", make_records(3))
+
+    assert len(upserts(server)) == publishing.MAX_RETRIES + 1
+
+
+def test_gives_up_after_max_retry_time(server, soda):
+    server.failures["POST"] = [503]
+    with pytest.raises(requests.exceptions.HTTPError):
+        publishing.with_retries(
+            soda.upsert, "flat-data", make_records(1), max_retry_time=0
+        )
+
+    assert len(upserts(server)) == 1
+
+
+def test_publish_uploads_concurrently(server, soda):
+    # Each upload blocks until the other one arrives, so this only succeeds if they overlap
+    server.barrier = threading.Barrier(2, timeout=5)
+    output = {"type": "FeatureCollection", "features": []}
+    records = make_records(3)
+    feed_response, flat_responses = publishing.publish(
+        soda, "feed-data", output, "flat-data", records
+    )
+
+    assert feed_response == {"id": "feed-data"}
+    assert len(flat_responses) == 1
+    assert json.dumps(output).encode("utf-8") in server.files["feed-data"]
+    assert server.rows == {r["id"]: r for r in records}
+
+
+def test_check_row_identifier(server, soda):
+    publishing.check_row_identifier(soda, "flat-data")
+
+
+@pytest.mark.parametrize("row_identifier_id", [None, 1])
+def test_check_row_identifier_wrong_column(server, soda, row_identifier_id):
+    server.metadata["rowIdentifierColumnId"] = row_identifier_id
+    with pytest.raises(ValueError):
+        publishing.check_row_identifier(soda, "flat-data")